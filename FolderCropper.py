@@ -11,17 +11,26 @@ import os
 import json
 import datetime as dt
 import re
+import html
 import logging
 import warnings
+import functools
+import threading
 import numpy as np
 import pandas as pd
 import scipy.signal as sg
 import ipywidgets as widgets
-from IPython.display import display, HTML, clear_output
+from IPython.display import display
 import plotly.graph_objects as go
 import sys
 from ipyevents import Event as IPyEvent  # 键盘事件
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson  # 可选依赖，断点序列化加速
+except ImportError:
+    orjson = None
 
 # 日志配置
 LOG_DIR = Path("./logs")
@@ -37,6 +46,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger("FolderCropper")
 
+_TAG_RE = re.compile(r'\W+')  # 标记前缀中的非法字符
+
+
+# ------------------------------------------------------------
+def _index_dtype(n):
+    """采样索引 dtype；优先 int32，使 Plotly 走 base64 类型数组传输而非 JSON 列表"""
+    return np.int32 if n <= np.iinfo(np.int32).max else np.int64
+
+
+def _decimate(y, target=10_000):
+    """
+    min/max 抽稀，用于主视图概览
+    每个分箱保留最小值与最大值（按原始时间顺序），返回 (x, y)；
+    x 为原始采样索引，因此框选坐标不受抽稀影响。
+    """
+    n = len(y)
+    dtype = _index_dtype(n)
+    if n <= target:
+        return np.arange(n, dtype=dtype), y
+    y = np.asarray(y)  # memmap → ndarray 视图，不复制
+    size = n // (target // 2)
+    n_bins = -(-n // size)  # 含不足一箱的尾部
+    x = np.empty(2 * n_bins, dtype=dtype)
+    m = n // size * size
+    bins = y[:m].reshape(-1, size)
+    lo = bins.argmin(axis=1)
+    hi = bins.argmax(axis=1)
+    if m < n:  # 尾部单独成箱，避免为补齐而复制整条信号
+        lo = np.append(lo, y[m:].argmin())
+        hi = np.append(hi, y[m:].argmax())
+    offs = np.arange(0, n, size, dtype=dtype)
+    x[0::2] = offs + np.minimum(lo, hi)
+    x[1::2] = offs + np.maximum(lo, hi)
+    return x, y[x]
+
+
 # ------------------------------------------------------------
 class FolderCropper:
     """
@@ -44,12 +89,15 @@ class FolderCropper:
     ---------------
     功能列表：
     1. 支持 .csv / .npy 单/双通道
-    2. 键盘快捷键（Ctrl+S 保存，Ctrl+D 跳过，Space 下一条）
+    2. 键盘快捷键（Ctrl+S 保存，Ctrl+D 跳过，Space / → 下一条）
     3. 亮色 / 暗色 Plotly 主题切换
     4. 滚动日志文件
     5. 断点续跑（JSON 进度保存）
     6. 生成裁剪报告（.txt 和 .html 格式）
     """
+    MAIN_COLORS = ["#1f77b4", "#ff7f0e"]
+    PREV_COLORS = ["#d62728", "#9467bd"]
+
     def __init__(self,
                  input_folder: str,
                  output_folder: str = "./cropped",
@@ -61,36 +109,67 @@ class FolderCropper:
         self.theme_dark = False
         self.theme = theme
         self.checkpoint_file = Path(checkpoint)
+        self._pending_ckpt = None
+        self._ckpt_timer = None
+        self._ckpt_lock = threading.Lock()
+        self._ckpt_write_lock = threading.Lock()
         self.input_folder = Path(input_folder).expanduser().resolve()
         self.output_folder = Path(output_folder).expanduser().resolve()
         self.output_folder.mkdir(parents=True, exist_ok=True)
+        self._output_folder_str = str(self.output_folder)
 
         logger.info("初始化 FolderCropper")
         logger.info(f"输入目录: {self.input_folder}")
         logger.info(f"输出目录: {self.output_folder}")
 
-        # 扫描文件
+        # 扫描文件（仅校验文件头，不读取数据）
+        self.meta = {}
         self._scan_files()
+        self._load_all()
         self.total_files = len(self.files)
         if self.total_files == 0:
             raise RuntimeError("未找到任何 .csv / .npy 文件")
         logger.info(f"共发现 {self.total_files} 个文件")
 
-        # 加载信号
-        self.signals = {}
-        self.meta = {}
-        self._load_all()
+        # 信号按需加载：LRU 缓存最近几条，后台线程预取下一条
+        self._get_signal = functools.lru_cache(maxsize=3)(self._read_signal)
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._prefetch = None  # (文件名, Future)
 
         # 断点续跑
         self._load_progress()
 
-        # 状态
+        # 状态；cur_key / sig 在 _draw_lock 下成对更新，保证后台绘制读到一致的快照
+        self._draw_lock = threading.Lock()
         self.cur_idx = 0
-        self.cur_key = self.files[self.cur_idx].name
-        self.sig = self.signals[self.cur_key]
+        if not self._load_current():
+            raise RuntimeError("未找到可读取的 .csv / .npy 文件")
 
-        # 裁剪记录
+        # 裁剪记录；片段追加写入 crops.dat，单独的 .npy 由后台线程写出
         self.clip_history = []
+        self._idx = None  # 预览用采样索引，按已见过的最大片段长度增长
+        self._sink = None
+        self._sink_index = None
+        self._io_pool = ThreadPoolExecutor(max_workers=1)
+
+        # 快捷键表：(修饰键, key) → 处理函数
+        self._keymap = {
+            ("ctrl", "s"): self._save_blue,
+            ("ctrl", "d"): self._skip_file,
+            ("", " "): self._next_file,
+            ("", "arrowright"): self._next_file,
+        }
+
+        # 主图绘制：切换文件时防抖；前端尚无视图时推迟到视图挂载后再画。
+        # 视图计数（_view_count）是 ipywidgets 的实验性功能，前端在超时内
+        # 未上报则停用该门控，直接绘制
+        self.sig_view = None  # 主视图概览（抽稀后的 float32），按文件缓存
+        self._view_key = None
+        self._drawn_key = None
+        self._draw_timer = None
+        self._draw_pending = False
+        self._view_gate = True
+        self._view_seen = False
 
         # GUI
         self._build_gui()
@@ -100,29 +179,97 @@ class FolderCropper:
     # --------------------------------------------------------
     def _scan_files(self):
         exts = {'.csv', '.npy'}
-        self.files = sorted([p for p in self.input_folder.iterdir()
-                             if p.suffix.lower() in exts])
-        logger.debug(f"文件列表: {[p.name for p in self.files]}")
+        # os.scandir 的 DirEntry 自带类型信息，普通文件无需逐个 stat
+        with os.scandir(self.input_folder) as it:
+            self.files = sorted(
+                (Path(e.path) for e in it
+                 if e.is_file()
+                 and os.path.splitext(e.name)[1].lower() in exts),
+                key=lambda p: p.name)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"文件列表: {[p.name for p in self.files]}")
 
     def _load_all(self):
+        """逐个检查文件头（.npy 读 header，.csv 试读首行），剔除无法读取的文件"""
+        good = []
         for p in self.files:
             try:
                 if p.suffix.lower() == '.csv':
-                    arr = pd.read_csv(p, header=None).to_numpy()
+                    pd.read_csv(p, header=None, nrows=1, engine="c", dtype=np.float32)
                 else:  # .npy
-                    arr = np.load(p)
-                if arr.ndim == 1:
-                    arr = arr[:, None]  # 转为 2-D 列向量
-                if arr.ndim != 2:
-                    raise ValueError("维度错误")
-                if arr.shape[0] > self.max_points:
-                    raise ValueError("点数超限")
-                self.signals[p.name] = arr.astype(np.float32)
-                self.meta[p.name] = {"shape": arr.shape, "type": p.suffix}
-                logger.debug(f"加载 {p.name} 成功")
+                    arr = self._check_signal(np.load(p, mmap_mode='r'))
+                    self.meta[p.name] = {"shape": arr.shape, "type": p.suffix}
+                good.append(p)
             except Exception as e:
                 logger.warning(f"[跳过] {p.name}: {e}")
-                self.files.remove(p)
+        self.files = good
+
+    def _check_signal(self, arr):
+        """校验 dtype / 维度 / 点数，返回二维数组（一维转为列向量）"""
+        if arr.dtype.kind not in "buif":  # 布尔 / 整数 / 浮点，可无损转为 float32 绘图与保存
+            raise ValueError("数据类型错误")
+        if arr.ndim == 1:
+            arr = arr[:, None]  # 转为 2-D 列向量
+        if arr.ndim != 2:
+            raise ValueError("维度错误")
+        if arr.shape[0] > self.max_points:
+            raise ValueError("点数超限")
+        return arr
+
+    def _read_signal(self, name):
+        """读取单个信号文件，返回二维数组（经 self._get_signal 缓存）
+
+        .csv 解析为 float32；.npy 以只读内存映射打开，保留磁盘上的 dtype，
+        仅在绘图 / 保存时按需转换为 float32。
+        """
+        p = self.input_folder / name
+        if p.suffix.lower() == '.csv':
+            # 分块解析：点数超限时立即中止，峰值内存不超过一个块加已读部分
+            parts, total = [], 0
+            with pd.read_csv(p, header=None, engine="c", dtype=np.float32,
+                             chunksize=200_000) as reader:
+                for chunk in reader:
+                    total += len(chunk)
+                    if total > self.max_points:
+                        raise ValueError("点数超限")
+                    parts.append(chunk.to_numpy(copy=False))
+            arr = parts[0] if len(parts) == 1 else np.concatenate(parts, axis=0)
+        else:  # .npy
+            arr = np.load(p, mmap_mode='r')
+        arr = self._check_signal(arr)
+        self.meta[name] = {"shape": arr.shape, "type": p.suffix}
+        logger.debug(f"加载 {name} 成功")
+        return arr
+
+    def _fetch(self, name):
+        # 若该文件正在后台预取，先等待其完成（成功结果已写入缓存，失败则直接沿用其异常）
+        if self._prefetch is not None and self._prefetch[0] == name:
+            exc = self._prefetch[1].exception()
+            if exc is not None:
+                raise exc
+        return self._get_signal(name)
+
+    def _prefetch_next(self):
+        if self.cur_idx + 1 < self.total_files:
+            name = self.files[self.cur_idx + 1].name
+            self._prefetch = (name, self._pool.submit(self._get_signal, name))
+
+    def _load_current(self):
+        """加载 cur_idx 指向的信号，读取失败则顺延；无可用文件时返回 False"""
+        while True:
+            name = self.files[self.cur_idx].name
+            try:
+                sig = self._fetch(name)  # 全分辨率，用于框选与保存
+            except Exception as e:
+                logger.warning(f"[跳过] {name}: {e}")
+                if self.cur_idx >= self.total_files - 1:
+                    return False
+                self.cur_idx += 1
+                continue
+            with self._draw_lock:
+                self.cur_key, self.sig = name, sig
+            self._prefetch_next()
+            return True
 
     # --------------------------------------------------------
     def _load_progress(self):
@@ -139,16 +286,35 @@ class FolderCropper:
             self.cur_idx = 0
 
     def _save_progress(self):
-        try:
-            with open(self.checkpoint_file, "w", encoding="utf-8") as f:
-                json.dump({"index": self.cur_idx, "time": str(dt.datetime.now())}, f)
-        except Exception as e:
-            logger.error(f"保存断点失败: {e}")
+        """登记断点，由后台定时器写盘；0.25 s 内的连续调用只写最后一次"""
+        with self._ckpt_lock:
+            self._pending_ckpt = {"index": self.cur_idx, "time": str(dt.datetime.now())}
+            if self._ckpt_timer is None:
+                self._ckpt_timer = threading.Timer(0.25, self._flush_ckpt)
+                self._ckpt_timer.start()
+
+    def _flush_ckpt(self):
+        with self._ckpt_write_lock:  # 保证写盘顺序与登记顺序一致
+            with self._ckpt_lock:
+                data, self._pending_ckpt = self._pending_ckpt, None
+                self._ckpt_timer = None
+            if data is None:
+                return
+            try:
+                if orjson is not None:
+                    self.checkpoint_file.write_bytes(orjson.dumps(data))
+                else:
+                    with open(self.checkpoint_file, "w", encoding="utf-8") as f:
+                        json.dump(data, f)
+            except Exception as e:
+                logger.error(f"保存断点失败: {e}")
 
     # --------------------------------------------------------
     def _build_gui(self):
         style = {"description_width": "initial"}
         self.out_main = widgets.Output(layout={"width": "100%", "height": "450px"})
+        self.out_main._view_count = 0  # 开启前端视图计数
+        self.out_main.observe(self._on_view_count, names="_view_count")
         self.out_prev = widgets.Output(layout={"width": "100%", "height": "200px"})
 
         self.btn_save = widgets.Button(description="保存 (Ctrl+S)", button_style="info")
@@ -168,12 +334,41 @@ class FolderCropper:
             self.btn_theme, self.tag, self.progress, self.label_done, self.btn_report
         ], layout=widgets.Layout(flex_flow="wrap"))
 
+        # 主图 / 预览图各建一次，之后仅原地更新曲线与布局
+        self.main_fig = go.FigureWidget(layout=go.Layout(
+            xaxis_title="sample index", yaxis_title="amplitude",
+            dragmode="select", hovermode="closest",
+            template=self.theme,
+            margin=dict(l=50, r=50, t=50, b=50)
+        ))
+        self._ensure_traces(self.main_fig, 2, self.MAIN_COLORS)
+        self.main_fig.data[0].on_selection(self._on_rect)
+        self.prev_fig = go.FigureWidget(layout=go.Layout(
+            xaxis_title="sample index", yaxis_title="amplitude",
+            template=self.theme,
+            margin=dict(l=50, r=50, t=50, b=50)
+        ))
+        self._ensure_traces(self.prev_fig, 2, self.PREV_COLORS)
+
+        self.banner = widgets.HTML(value="")
+
         display(widgets.VBox([
-            widgets.Label("FolderCropper | 快捷键 Ctrl+S / Ctrl+D / Space | 日志↓"),
+            widgets.Label("FolderCropper | 快捷键 Ctrl+S / Ctrl+D / Space / → | 日志↓"),
             controls,
+            self.banner,
             self.out_main,
             self.out_prev
         ]))
+        # 图表只挂载一次，之后不再 clear_output / display
+        self.out_main.append_display_data(self.main_fig)
+        self.out_prev.append_display_data(self.prev_fig)
+        threading.Timer(1.0, self._view_gate_timeout).start()
+
+    def _ensure_traces(self, fig, n, colors):
+        """保证 fig 至少有 n 条曲线（不足则追加）；需在 batch_update 之外调用"""
+        for ch in range(len(fig.data), n):
+            fig.add_scattergl(mode="lines", line=dict(color=colors[ch % len(colors)]),
+                              name=f"CH{ch}")
 
     # --------------------------------------------------------
     def _bind_shortcuts(self):
@@ -181,39 +376,70 @@ class FolderCropper:
         self.kb.on_dom_event(self._handle_key)
 
     def _handle_key(self, event):
-        if event.get("ctrlKey"):
-            if event.get("key") == "s":
-                self._save_blue(None)
-            elif event.get("key") == "d":
-                self._skip_file(None)
-        elif event.get("key") == " ":
-            self._next_file(None)
+        mod = "ctrl" if event.get("ctrlKey") else ""
+        fn = self._keymap.get((mod, event.get("key", "").lower()))
+        if fn is not None:
+            fn(None)  # 长按时的重绘由 _schedule_draw 防抖合并
 
     # --------------------------------------------------------
+    def _schedule_draw(self, delay=0.1):
+        """延迟绘制主图；计时期间再次调用则取消上一次，连续切换只画最后一个文件"""
+        if self._draw_timer is not None:
+            self._draw_timer.cancel()
+        self._draw_timer = threading.Timer(delay, self._draw_main_safe)
+        self._draw_timer.start()
+
+    def _draw_main_safe(self):
+        # 定时器线程中的异常不会自动进入日志，需在此捕获
+        try:
+            self._draw_main()
+        except Exception:
+            logger.exception("绘制主图失败")
+
+    def _on_view_count(self, change):
+        self._view_seen = True
+        if change["new"] and self._draw_pending:
+            self._draw_main()
+
+    def _view_gate_timeout(self):
+        # 前端未上报视图计数：停用门控并补画挂起的绘制
+        if self._view_seen:
+            return
+        self._view_gate = False
+        if self._draw_pending:
+            self._draw_main_safe()
+
     def _draw_main(self):
-        idx = np.arange(self.sig.shape[0])
-        data = []
-        colors = ["#1f77b4", "#ff7f0e"]
-        for ch in range(self.sig.shape[1]):
-            data.append(go.Scatter(
-                x=idx, y=self.sig[:, ch],
-                mode="lines", line=dict(color=colors[ch % len(colors)]),
-                name=f"CH{ch}"
-            ))
-        layout = go.Layout(
-            title=f"{self.cur_key}  |  {self.sig.shape}",
-            xaxis_title="sample index", yaxis_title="amplitude",
-            dragmode="select", hovermode="x unified",
-            template=self.theme,
-            margin=dict(l=50, r=50, t=50, b=50)
-        )
-        self.main_fig = go.FigureWidget(data=data, layout=layout)
-        self.main_fig.data[0].on_selection(self._on_rect)
-        with self.out_main:
-            self.out_main.clear_output(wait=True)
-            display(self.main_fig)
+        # 前端尚未挂载视图（或视图已全部关闭）时等待；滚出可视区不影响计数
+        if self._view_gate and self.out_main._view_count == 0:
+            self._draw_pending = True
+            return
+        with self._draw_lock:
+            self._draw_pending = False
+            key, sig = self.cur_key, self.sig
+            if self._view_key != key:
+                # 抽稀后的 float32 概览按文件缓存，主题切换 / 重绘无需重新计算
+                view = []
+                for ch in range(sig.shape[1]):
+                    x, y = _decimate(sig[:, ch])
+                    view.append((x, np.ascontiguousarray(y, dtype=np.float32)))
+                self.sig_view, self._view_key = view, key
+            n_ch = len(self.sig_view)
+            self._ensure_traces(self.main_fig, n_ch, self.MAIN_COLORS)
+            with self.main_fig.batch_update():
+                for ch, trace in enumerate(self.main_fig.data):
+                    if ch < n_ch:
+                        x, y = self.sig_view[ch]
+                        trace.update(x=x, y=y, visible=True)
+                    else:
+                        trace.update(x=None, y=None, visible=False)
+                self.main_fig.layout.title = f"{key}  |  {sig.shape}"
+                self.main_fig.layout.template = self.theme
+            self._drawn_key = key
 
     def _on_rect(self, trace, points, selector):
+        if self._drawn_key != self.cur_key:  # 主图尚未刷新到当前文件，忽略旧图上的框选
+            return
         if selector.xrange:
             x0, x1 = map(int, selector.xrange)
             self.x0, self.x1 = x0, x1
@@ -221,70 +447,102 @@ class FolderCropper:
             self._draw_preview()
 
     def _draw_preview(self):
-        idx = np.arange(self.cropped.shape[0])
-        data = []
-        colors = ["#d62728", "#9467bd"]
-        for ch in range(self.cropped.shape[1]):
-            data.append(go.Scatter(
-                x=idx, y=self.cropped[:, ch],
-                mode="lines", line=dict(color=colors[ch % len(colors)]),
-                name=f"CH{ch}"
-            ))
-        layout = go.Layout(
-            title=f"预览 {self.cropped.shape}",
-            xaxis_title="sample index", yaxis_title="amplitude",
-            template=self.theme,
-            margin=dict(l=50, r=50, t=50, b=50)
-        )
-        with self.out_prev:
-            self.out_prev.clear_output(wait=True)
-            display(go.Figure(data=data, layout=layout))
+        n, n_ch = self.cropped.shape
+        if self._idx is None or len(self._idx) < n:
+            self._idx = np.arange(n, dtype=_index_dtype(n))  # 索引与文件无关，可跨文件复用
+        idx = self._idx[:n]  # 取前缀视图，各通道共用同一 x 数组
+        ys = np.ascontiguousarray(self.cropped.T, dtype=np.float32)  # 一次转换，每行即一个连续通道
+        self._ensure_traces(self.prev_fig, n_ch, self.PREV_COLORS)
+        with self.prev_fig.batch_update():
+            for ch, trace in enumerate(self.prev_fig.data):
+                if ch < n_ch:
+                    trace.update(x=idx, y=ys[ch], visible=True)
+                else:
+                    trace.update(x=None, y=None, visible=False)
+            self.prev_fig.layout.title = f"预览 {self.cropped.shape}"
 
     # --------------------------------------------------------
     def _save_blue(self, _):
         if not hasattr(self, "cropped"):
             logger.warning("未框选区域")
             return
-        tag = re.sub(r'\W+', '_', self.tag.value.strip())
+        tag = _TAG_RE.sub('_', self.tag.value).strip('_')
         prefix = f"{tag}_" if tag else ""
         base = f"{prefix}{Path(self.cur_key).stem}_x{self.x0}_{self.x1}.npy"
-        out_path = self.output_folder / base
-        np.save(out_path, self.cropped)
-        logger.info(f"已保存 → {out_path}")
-        self.clip_history.append({
+        out_path = f"{self._output_folder_str}{os.sep}{base}"
+        crop = np.ascontiguousarray(self.cropped, dtype=np.float32)
+        entry = {
             "file_name": self.cur_key,
             "start_index": self.x0,
             "end_index": self.x1,
-            "save_path": str(out_path),
-            "timestamp": dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+            "save_path": out_path,
+            "timestamp": dt.datetime.now().isoformat(sep=" ", timespec="seconds")
+        }
+        self._append_sink(crop, entry)
+        self._io_pool.submit(self._write_npy, out_path, crop, entry)
+        self.clip_history.append(entry)
         self._next_file(None)
 
+    def _append_sink(self, crop, entry):
+        """
+        追加写入 crops.dat（float32 原始字节，行优先），并在 crops_index.jsonl 记录索引
+        读取示例：np.fromfile(path, np.float32, count=n*ch, offset=off).reshape(n, ch)
+        """
+        if self._sink is None:
+            self._sink = open(self.output_folder / "crops.dat", "ab")
+            self._sink_index = open(self.output_folder / "crops_index.jsonl", "a", encoding="utf-8")
+        entry["sink_offset"] = self._sink.tell()
+        entry["n_samples"], entry["n_channels"] = crop.shape
+        crop.tofile(self._sink)
+        self._sink.flush()
+        self._sink_index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._sink_index.flush()
+
+    def _write_npy(self, path, crop, entry):
+        # 后台线程执行；失败时在记录中注明，避免报告列出不存在的文件
+        try:
+            np.save(path, crop)
+        except Exception as e:
+            logger.error(f"保存失败 {path}: {e}")
+            entry["save_path"] = f"{path}（保存失败: {e}）"
+        else:
+            logger.info(f"已保存 → {path}")
+
+    def close(self):
+        """关闭 crops.dat / crops_index.jsonl；之后再次保存会重新以追加方式打开"""
+        if self._sink is not None:
+            self._sink.close()
+            self._sink_index.close()
+            self._sink = self._sink_index = None
+
     def _skip_file(self, _):
         logger.info("用户跳过")
         self._next_file(None)
 
     def _next_file(self, _):
+        # 先取消尚未触发的绘制，避免其在加载新文件期间画出旧信号
+        if self._draw_timer is not None:
+            self._draw_timer.cancel()
         if self.cur_idx < self.total_files - 1:
             self.cur_idx += 1
-            self.cur_key = self.files[self.cur_idx].name
-            self.sig = self.signals[self.cur_key]
-            self.progress.value = self.cur_idx + 1  # 更新进度条
-            self.label_done.value = f"{self.cur_idx + 1}/{self.total_files}"  # 更新已完成数量
-            self._save_progress()
-            self._draw_main()
-        else:
-            logger.info("全部完成")
-            with self.out_main:
-                self.out_main.clear_output()
-                display(HTML("<h2>🎉 全部文件已处理完成</h2>"))
+            if self._load_current():
+                self.progress.value = self.cur_idx + 1  # 更新进度条
+                self.label_done.value = f"{self.cur_idx + 1}/{self.total_files}"  # 更新已完成数量
+                self._save_progress()
+                self._schedule_draw()
+                return
+        logger.info("全部完成")
+        self.close()
+        self.banner.value = "<h2>🎉 全部文件已处理完成</h2>"
+        self.out_main.layout.display = "none"
 
     # --------------------------------------------------------
     def _toggle_theme(self, _):
         self.theme_dark = not self.theme_dark
         self.theme = "plotly_dark" if self.theme_dark else "plotly_white"
         logger.info(f"切换主题 → {self.theme}")
-        self._draw_main()
+        self.main_fig.layout.template = self.theme
+        self.prev_fig.layout.template = self.theme
 
     # --------------------------------------------------------
     def _generate_report(self, _):
@@ -295,16 +553,19 @@ class FolderCropper:
         with open(report_path_txt, "w", encoding="utf-8") as f:
             f.write("裁剪报告\n")
             f.write("========\n\n")
-            for entry in self.clip_history:
-                f.write(f"文件名: {entry['file_name']}\n")
-                f.write(f"起始索引: {entry['start_index']}\n")
-                f.write(f"结束索引: {entry['end_index']}\n")
-                f.write(f"保存路径: {entry['save_path']}\n")
-                f.write(f"时间戳: {entry['timestamp']}\n")
-                f.write("\n")
-
-        # 生成 HTML 报告
-        html_content = """
+            f.writelines(
+                f"文件名: {entry['file_name']}\n"
+                f"起始索引: {entry['start_index']}\n"
+                f"结束索引: {entry['end_index']}\n"
+                f"保存路径: {entry['save_path']}\n"
+                f"时间戳: {entry['timestamp']}\n"
+                "\n"
+                for entry in self.clip_history
+            )
+
+        # 生成 HTML 报告（逐行写入文件，避免字符串反复拼接）
+        with open(report_path_html, "w", encoding="utf-8") as f:
+            f.write("""
         <html>
         <head>
             <title>裁剪报告</title>
@@ -323,24 +584,19 @@ class FolderCropper:
                     <th>保存路径</th>
                     <th>时间戳</th>
                 </tr>
-        """
-        for entry in self.clip_history:
-            html_content += f"""
-                <tr>
-                    <td>{entry['file_name']}</td>
-                    <td>{entry['start_index']}</td>
-                    <td>{entry['end_index']}</td>
-                    <td>{entry['save_path']}</td>
-                    <td>{entry['timestamp']}</td>
-                </tr>
-            """
-        html_content += """
+""")
+            f.writelines(
+                "                <tr>"
+                + "".join(f"<td>{html.escape(str(entry[k]))}</td>" for k in (
+                    "file_name", "start_index", "end_index", "save_path", "timestamp"))
+                + "</tr>\n"
+                for entry in self.clip_history
+            )
+            f.write("""
             </table>
         </body>
         </html>
-        """
-        with open(report_path_html, "w", encoding="utf-8") as f:
-            f.write(html_content)
+        """)
 
         logger.info(f"报告已生成并保存到 {report_path_txt} 和 {report_path_html}")
 